@@ -1,42 +1,39 @@
 from openai import OpenAI
 import html
 
+# نقشه تصحیح کاراکترهای نروژی (فقط برای حالت fallback)
+MOJIBAKE_REPLACEMENTS = {
+    'Ã¥': 'å',
+    'Ã¦': 'æ',
+    'Ã¸': 'ø',
+    'Ã…': 'Å',
+    'Ã†': 'Æ',
+    'Ã˜': 'Ø',
+}
+
 def clean_text(text):
     """تمیز کردن متن از کاراکترهای مشکل‌دار"""
-    # تبدیل HTML entities
-    text = html.unescape(text)
-    
-    # تصحیح کاراکترهای نروژی
-    replacements = {
-        'Ã¥': 'å',
-        'Ã¦': 'æ', 
-        'Ã¸': 'ø',
-        'Ã…': 'Å',
-        'Ã†': 'Æ',
-        'Ã˜': 'Ø',
-        'nÃ¥': 'nå',
-        'pÃ¥': 'på',
-        'sÃ¥': 'så',
-        'mÃ¥': 'må',
-        'gÃ¥': 'gå',
-        'fÃ¸': 'fø',
-        'gjÃ¸': 'gjø',
-        'hÃ¸': 'hø',
-        'skjÃ¸': 'skjø',
-        'Ã¸de': 'øde'
-    }
+    # تبدیل HTML entities (فقط در صورت وجود '&')
+    if '&' in text:
+        text = html.unescape(text)
     
-    for old, new in replacements.items():
-        text = text.replace(old, new)
+    # تصحیح کاراکترهای نروژی (UTF-8 که به صورت cp1252 خوانده شده)
+    # بازگرداندن کل رشته در یک مرحله؛ در صورت شکست، جایگزینی تکی
+    if 'Ã' in text:
+        try:
+            text = text.encode('cp1252').decode('utf-8')
+        except UnicodeError:
+            for old, new in MOJIBAKE_REPLACEMENTS.items():
+                text = text.replace(old, new)
     
     return text.strip()
 
 def seconds_to_srt_time(seconds):
     """تبدیل ثانیه به فرمت زمان SRT"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millisecs = int((seconds % 1) * 1000)
+    # محاسبه با میلی‌ثانیه صحیح و divmod به جای عملیات اعشاری
+    secs, millisecs = divmod(round(seconds * 1000), 1000)
+    minutes, secs = divmod(secs, 60)
+    hours, minutes = divmod(minutes, 60)
     return f"{hours:02d}:{minutes:02d}:{secs:02d},{millisecs:03d}"
 
 # تنظیم client
@@ -55,26 +52,19 @@ with open("Rykter.wav", "rb") as audio_file:
         language="no"
     )
 
-# ایجاد فایل SRT تمیز
-srt_content = []
-segment_number = 1
-
-for segment in transcript.segments:
-    start_time = segment.start
-    end_time = segment.end
-    text = clean_text(segment.text)
-    
-    # ساخت فرمت SRT
-    srt_content.append(str(segment_number))
-    srt_content.append(f"{seconds_to_srt_time(start_time)} --> {seconds_to_srt_time(end_time)}")
-    srt_content.append(text)
-    srt_content.append("")  # خط خالی
-    
-    segment_number += 1
-
-# نوشتن فایل SRT تمیز
-with open("1.srt", "w", encoding="utf-8") as f:
-    f.write("\n".join(srt_content))
+# ایجاد و نوشتن فایل SRT تمیز
+with open("1.srt", "w", encoding="utf-8", buffering=1 << 20) as f:
+    for segment_number, segment in enumerate(transcript.segments, 1):
+        start_time = segment.start
+        end_time = segment.end
+        text = clean_text(segment.text)
+        
+        # ساخت فرمت SRT
+        f.write(
+            f"{segment_number}\n"
+            f"{seconds_to_srt_time(start_time)} --> {seconds_to_srt_time(end_time)}\n"
+            f"{text}\n\n"  # خط خالی
+        )
 
 print("فایل 1.srt با فرمت استاندارد و کاراکترهای تمیز ایجاد شد!")
 print(f"تعداد segments: {len(transcript.segments)}")
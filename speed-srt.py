@@ -1,14 +1,27 @@
-import os
 import sys
+import io
+import atexit
 import html
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Dict
+from types import SimpleNamespace
+from typing import Optional, Dict, List, Tuple, Union
 from groq import Groq
 
 
 class AudioToSRTConverter:
     """تبدیل فایل‌های صوتی به زیرنویس SRT با استفاده از Groq API"""
     
+    # فایل‌های بزرگ‌تر از این سایز قبل از ارسال تقسیم می‌شوند (MB)
+    MAX_FILE_SIZE_MB = 24
+    # سایز تقریبی هر قطعه (MB)
+    CHUNK_SIZE_MB = 20
+    # تعداد درخواست‌های همزمان برای قطعات
+    MAX_WORKERS = 4
+    
     def __init__(self, api_key: str):
         """
         مقداردهی اولیه converter
@@ -18,14 +31,10 @@ class AudioToSRTConverter:
         """
         self.client = Groq(api_key=api_key)
         
-        # نقشه تصحیح کاراکترهای نروژی و سایر زبان‌ها
+        # نقشه تصحیح کاراکترهای نروژی (فقط برای حالت fallback)
         self.char_replacements = {
             'Ã¥': 'å', 'Ã¦': 'æ', 'Ã¸': 'ø',
-            'Ã…': 'Å', 'Ã†': 'Æ', 'Ã˜': 'Ø',
-            'nÃ¥': 'nå', 'pÃ¥': 'på', 'sÃ¥': 'så',
-            'mÃ¥': 'må', 'gÃ¥': 'gå', 'fÃ¸': 'fø',
-            'gjÃ¸': 'gjø', 'hÃ¸': 'hø', 'skjÃ¸': 'skjø',
-            'Ã¸de': 'øde'
+            'Ã…': 'Å', 'Ã†': 'Æ', 'Ã˜': 'Ø'
         }
     
     @staticmethod
@@ -40,12 +49,19 @@ class AudioToSRTConverter:
         Returns:
             متن تمیز شده
         """
-        # تبدیل HTML entities
-        text = html.unescape(text)
+        # تبدیل HTML entities (فقط در صورت وجود '&')
+        if '&' in text:
+            text = html.unescape(text)
         
-        # اعمال جایگزینی‌های کاراکتر
-        for old, new in replacements.items():
-            text = text.replace(old, new)
+        # تصحیح mojibake (UTF-8 خوانده شده به صورت cp1252) در یک مرحله؛
+        # متن‌های بدون 'Ã' بدون هیچ پردازشی عبور می‌کنند
+        if 'Ã' in text:
+            try:
+                text = text.encode('cp1252').decode('utf-8')
+            except UnicodeError:
+                # متن ترکیبی: اعمال جایگزینی‌های کاراکتر
+                for old, new in replacements.items():
+                    text = text.replace(old, new)
         
         return text.strip()
     
@@ -60,15 +76,15 @@ class AudioToSRTConverter:
         Returns:
             رشته زمان به فرمت SRT
         """
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        millisecs = int((seconds % 1) * 1000)
+        # محاسبه با میلی‌ثانیه صحیح و divmod به جای عملیات اعشاری
+        secs, millisecs = divmod(round(seconds * 1000), 1000)
+        minutes, secs = divmod(secs, 60)
+        hours, minutes = divmod(minutes, 60)
         return f"{hours:02d}:{minutes:02d}:{secs:02d},{millisecs:03d}"
     
     def transcribe_audio(
         self,
-        audio_path: str,
+        audio_path: Union[str, Path],
         language: str = "no",
         model: str = "whisper-large-v3-turbo",
         prompt: Optional[str] = None,
@@ -87,39 +103,164 @@ class AudioToSRTConverter:
         Returns:
             نتیجه transcription شامل segments و metadata
         """
-        # بررسی وجود فایل
-        if not os.path.exists(audio_path):
-            raise FileNotFoundError(f"❌ فایل صوتی پیدا نشد: {audio_path}")
+        audio_path = Path(audio_path)
         
-        # بررسی سایز فایل (محدودیت 25MB برای free tier)
-        file_size_mb = os.path.getsize(audio_path) / (1024 * 1024)
+        # بررسی وجود فایل و سایز آن با یک فراخوانی stat
+        # (محدودیت 25MB برای free tier)
+        try:
+            file_size_mb = audio_path.stat().st_size / (1024 * 1024)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"❌ فایل صوتی پیدا نشد: {audio_path}") from None
         print(f"📁 سایز فایل: {file_size_mb:.2f} MB")
         
-        if file_size_mb > 25:
-            print(f"⚠️  هشدار: سایز فایل بیشتر از 25MB است.")
-            print("   توصیه می‌شود فایل را به فرمت FLAC تبدیل کنید.")
-        
-        print(f"🎙️  در حال transcribe کردن {Path(audio_path).name}...")
+        print(f"🎙️  در حال transcribe کردن {audio_path.name}...")
         print(f"   مدل: {model}")
         print(f"   زبان: {language}")
+        # نمایش وضعیت قبل از انتظار برای پاسخ API
+        sys.stdout.flush()
         
-        # خواندن فایل و ارسال به صورت tuple (برای رفع مشکل Content-Length)
-        filename = Path(audio_path).name
-        with open(audio_path, "rb") as audio_file:
-            audio_data = audio_file.read()
-        
-        transcription = self.client.audio.transcriptions.create(
-            file=(filename, audio_data),
+        request_kwargs = dict(
             model=model,
-            response_format="verbose_json",
             language=language,
             prompt=prompt,
-            temperature=temperature,
-            timestamp_granularities=["segment"]
+            temperature=temperature
         )
         
+        if file_size_mb <= self.MAX_FILE_SIZE_MB:
+            return self._transcribe_file(audio_path, **request_kwargs)
+        
+        # فایل‌های بزرگ: تقسیم با ffmpeg و transcribe موازی قطعات
+        print(f"⚠️  سایز فایل بیشتر از {self.MAX_FILE_SIZE_MB}MB است؛ تقسیم به قطعات کوچک‌تر...")
+        with tempfile.TemporaryDirectory(prefix="speed-srt-") as tmp_dir:
+            chunks = self._split_audio(audio_path, tmp_dir, file_size_mb)
+            print(f"   تعداد قطعات: {len(chunks)}")
+            
+            with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+                results = list(executor.map(
+                    lambda chunk: self._transcribe_file(chunk[0], **request_kwargs),
+                    chunks
+                ))
+        
+        return self._merge_transcriptions(results, [offset for _, offset in chunks])
+    
+    def _transcribe_file(
+        self,
+        audio_path: Path,
+        model: str,
+        language: str,
+        prompt: Optional[str],
+        temperature: float
+    ) -> Dict:
+        """
+        ارسال یک فایل صوتی (حداکثر 25MB) به Groq API
+        
+        Args:
+            audio_path: مسیر فایل صوتی
+            model: مدل Whisper
+            language: کد زبان
+            prompt: راهنمای اختیاری برای مدل
+            temperature: دمای مدل
+            
+        Returns:
+            نتیجه transcription
+        """
+        # ارسال فایل به صورت tuple (برای رفع مشکل Content-Length)
+        # شیء فایل باز مستقیماً ارسال می‌شود تا httpx طول آن را با fstat بخواند
+        # و محتوا بدون کپی کامل در حافظه stream شود
+        with open(audio_path, "rb") as audio_file:
+            transcription = self.client.audio.transcriptions.create(
+                file=(audio_path.name, audio_file),
+                model=model,
+                response_format="verbose_json",
+                language=language,
+                prompt=prompt,
+                temperature=temperature,
+                timestamp_granularities=["segment"]
+            )
+        
         return transcription
     
+    def _split_audio(
+        self,
+        audio_path: Path,
+        output_dir: str,
+        file_size_mb: float
+    ) -> List[Tuple[Path, float]]:
+        """
+        تقسیم فایل صوتی به قطعات کوچک‌تر از CHUNK_SIZE_MB با ffmpeg
+        
+        Args:
+            audio_path: مسیر فایل صوتی
+            output_dir: پوشه موقت برای قطعات
+            file_size_mb: سایز فایل به مگابایت
+            
+        Returns:
+            لیست (مسیر قطعه، زمان شروع قطعه به ثانیه)
+        """
+        if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+            raise RuntimeError("ffmpeg/ffprobe برای تقسیم فایل‌های بزرگ لازم است")
+        
+        # محاسبه طول هر قطعه بر اساس نسبت سایز به مدت زمان فایل
+        duration = float(subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "csv=p=0", str(audio_path)],
+            capture_output=True, text=True, check=True
+        ).stdout.strip())
+        segment_time = max(1, int(duration * self.CHUNK_SIZE_MB / file_size_mb))
+        
+        # فقط جریان صوتی کپی می‌شود (ویدئوی فایل‌های mp4 حذف می‌شود تا برش
+        # به keyframe ویدئو وابسته نباشد) و زمان هر قطعه از صفر شروع می‌شود
+        # تا offset فقط یک بار در _merge_transcriptions اعمال شود
+        output_dir = Path(output_dir)
+        list_path = output_dir / "chunks.csv"
+        subprocess.run(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", str(audio_path),
+             "-map", "0:a", "-c", "copy",
+             "-f", "segment", "-segment_time", str(segment_time),
+             "-segment_list", str(list_path), "-segment_list_type", "csv",
+             "-reset_timestamps", "1",
+             str(output_dir / f"chunk_%03d{audio_path.suffix}")],
+            check=True
+        )
+        
+        # هر خط فهرست: نام قطعه، زمان شروع، زمان پایان
+        chunks = []
+        with open(list_path, encoding="utf-8") as f:
+            for line in f:
+                name, start, _ = line.strip().rsplit(",", 2)
+                chunks.append((output_dir / name, float(start)))
+        
+        return chunks
+    
+    @staticmethod
+    def _merge_transcriptions(results: List, offsets: List[float]) -> SimpleNamespace:
+        """
+        ادغام نتایج transcription قطعات با اعمال offset زمانی
+        
+        Args:
+            results: نتایج transcription به ترتیب قطعات
+            offsets: زمان شروع هر قطعه به ثانیه
+            
+        Returns:
+            نتیجه ادغام‌شده با همان ساختار segments/duration
+        """
+        segments = []
+        for result, offset in zip(results, offsets):
+            for segment in result.segments:
+                segments.append({
+                    **segment,
+                    "id": len(segments),
+                    "start": segment["start"] + offset,
+                    "end": segment["end"] + offset
+                })
+        
+        return SimpleNamespace(
+            text=" ".join(result.text.strip() for result in results),
+            segments=segments,
+            duration=offsets[-1] + results[-1].duration,
+            language=getattr(results[0], "language", None)
+        )
+    
     def generate_srt(
         self,
         transcription: Dict,
@@ -134,32 +275,24 @@ class AudioToSRTConverter:
             output_path: مسیر فایل خروجی SRT
             clean_chars: فعال‌سازی تمیزسازی کاراکترها
         """
-        srt_content = []
-        segment_number = 1
-        
-        for segment in transcription.segments:
-            start_time = segment["start"]
-            end_time = segment["end"]
-            text = segment["text"]
-            
-            # تمیزسازی متن در صورت نیاز
-            if clean_chars:
-                text = self.clean_text(text, self.char_replacements)
-            
-            # ساخت فرمت SRT
-            srt_content.append(str(segment_number))
-            srt_content.append(
-                f"{self.seconds_to_srt_time(start_time)} --> "
-                f"{self.seconds_to_srt_time(end_time)}"
-            )
-            srt_content.append(text)
-            srt_content.append("")  # خط خالی بین segments
-            
-            segment_number += 1
-        
-        # نوشتن فایل SRT
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write("\n".join(srt_content))
+        # نوشتن مستقیم هر segment در فایل (بدون ساخت لیست کامل در حافظه)
+        with open(output_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+            for segment_number, segment in enumerate(transcription.segments, 1):
+                start_time = segment["start"]
+                end_time = segment["end"]
+                text = segment["text"]
+                
+                # تمیزسازی متن در صورت نیاز
+                if clean_chars:
+                    text = self.clean_text(text, self.char_replacements)
+                
+                # ساخت فرمت SRT (خط خالی بین segments)
+                f.write(
+                    f"{segment_number}\n"
+                    f"{self.seconds_to_srt_time(start_time)} --> "
+                    f"{self.seconds_to_srt_time(end_time)}\n"
+                    f"{text}\n\n"
+                )
         
         print(f"✅ فایل SRT ایجاد شد: {output_path}")
     
@@ -204,7 +337,7 @@ class AudioToSRTConverter:
     
     def convert(
         self,
-        audio_path: str,
+        audio_path: Union[str, Path],
         output_path: Optional[str] = None,
         language: str = "no",
         model: str = "whisper-large-v3-turbo",
@@ -220,9 +353,11 @@ class AudioToSRTConverter:
             model: مدل Whisper
             analyze_quality: نمایش تحلیل کیفیت
         """
+        audio_path = Path(audio_path)
+        
         # تعیین مسیر خروجی
         if output_path is None:
-            output_path = Path(audio_path).stem + ".srt"
+            output_path = audio_path.stem + ".srt"
         
         # Transcription
         transcription = self.transcribe_audio(
@@ -239,27 +374,44 @@ class AudioToSRTConverter:
             self.analyze_transcription_quality(transcription)
 
 
+def buffer_stdout() -> None:
+    """بافر کردن خروجی وضعیت؛ نوشتن فقط هنگام flush یا پایان برنامه"""
+    sys.stdout.flush()
+    sys.stdout = io.TextIOWrapper(
+        sys.stdout.buffer,
+        encoding="utf-8",
+        line_buffering=False,
+        write_through=False
+    )
+    atexit.register(sys.stdout.flush)
+
+
 def print_usage():
     """نمایش راهنمای استفاده"""
-    print("=" * 60)
-    print("🎬 تبدیل فایل صوتی به زیرنویس SRT با Groq API")
-    print("=" * 60)
-    print("\n📖 نحوه استفاده:")
-    print("   python3 a.py <آدرس_فایل_صوتی> <نام_فایل_خروجی>")
-    print("\n💡 مثال:")
-    print("   python3 a.py audio.flac output.srt")
-    print("   python3 a.py /path/to/video.mp4 subtitle")
-    print("\n📝 توجه:")
-    print("   - اگر نام خروجی را وارد نکنید، از نام فایل ورودی استفاده می‌شود")
-    print("   - پسوند .srt به صورت خودکار اضافه می‌شود")
-    print("\n🌍 فرمت‌های پشتیبانی شده:")
-    print("   flac, mp3, mp4, wav, webm, m4a, ogg, mpeg, mpga")
-    print("=" * 60)
+    separator = "=" * 60
+    print(
+        f"{separator}\n"
+        "🎬 تبدیل فایل صوتی به زیرنویس SRT با Groq API\n"
+        f"{separator}\n"
+        "\n📖 نحوه استفاده:\n"
+        "   python3 a.py <آدرس_فایل_صوتی> <نام_فایل_خروجی>\n"
+        "\n💡 مثال:\n"
+        "   python3 a.py audio.flac output.srt\n"
+        "   python3 a.py /path/to/video.mp4 subtitle\n"
+        "\n📝 توجه:\n"
+        "   - اگر نام خروجی را وارد نکنید، از نام فایل ورودی استفاده می‌شود\n"
+        "   - پسوند .srt به صورت خودکار اضافه می‌شود\n"
+        "\n🌍 فرمت‌های پشتیبانی شده:\n"
+        "   flac, mp3, mp4, wav, webm, m4a, ogg, mpeg, mpga\n"
+        f"{separator}"
+    )
 
 
 def main():
     """تابع اصلی برای استفاده از converter با آرگومان‌های خط فرمان"""
     
+    buffer_stdout()
+    
     # بررسی آرگومان‌ها
     if len(sys.argv) < 2:
         print_usage()
@@ -288,12 +440,15 @@ def main():
         print("   2. مستقیماً در کد: API_KEY = 'your_key'")
         sys.exit(1)
     
-    print("\n" + "=" * 60)
-    print("🚀 شروع پردازش...")
-    print("=" * 60)
-    print(f"📂 فایل ورودی: {audio_file}")
-    print(f"💾 فایل خروجی: {output_file}")
-    print("=" * 60 + "\n")
+    separator = "=" * 60
+    print(
+        f"\n{separator}\n"
+        "🚀 شروع پردازش...\n"
+        f"{separator}\n"
+        f"📂 فایل ورودی: {audio_file}\n"
+        f"💾 فایل خروجی: {output_file}\n"
+        f"{separator}\n"
+    )
     
     try:
         # ایجاد converter
@@ -308,9 +463,7 @@ def main():
             analyze_quality=True
         )
         
-        print("\n" + "=" * 60)
-        print("🎉 پردازش با موفقیت انجام شد!")
-        print("=" * 60)
+        print(f"\n{separator}\n🎉 پردازش با موفقیت انجام شد!\n{separator}")
         
     except FileNotFoundError as e:
         print(f"\n❌ خطا: {e}")
@@ -6,35 +6,71 @@ Author: SRT Translation Tool
 Version: 2.0.0 - Optimized for Groq API with Llama 3.3 70B
 """
 
+import io
 import re
+import sys
 import time
+import random
 import json
 from typing import List, Optional, Dict
 from dataclasses import dataclass
 from pathlib import Path
 import logging
 import argparse
+import atexit
+import queue
+from logging.handlers import QueueHandler, QueueListener
+import threading
+from itertools import islice
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
 
 try:
-    from groq import Groq
+    from groq import Groq, RateLimitError, APIConnectionError, APIStatusError
 except ImportError:
     print("❌ خطا: کتابخانه Groq نصب نیست. لطفاً ابتدا آن را نصب کنید:")
     print("   pip install groq")
     exit(1)
 
-# تنظیمات لاگینگ
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('srt_translation.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# تنظیمات لاگینگ: threadها فقط رکورد را در صف قرار می‌دهند و
+# یک thread پس‌زمینه آن را در فایل و کنسول می‌نویسد
+_log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+_log_handlers = [
+    logging.FileHandler('srt_translation.log', encoding='utf-8'),
+    logging.StreamHandler()
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+
+_log_queue = queue.Queue(-1)
+_root_logger = logging.getLogger()
+_root_logger.setLevel(logging.INFO)
+_root_logger.addHandler(QueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 logger = logging.getLogger(__name__)
 
+# الگوهای regex (یک بار در زمان بارگذاری ماژول کامپایل می‌شوند)
+_SRT_BLOCK_RE = re.compile(
+    r'^\s*(\d+)\s*\n'
+    r'(\d{2}:\d{2}:\d{2}[,\.]\d{3})\s*-->\s*'
+    r'(\d{2}:\d{2}:\d{2}[,\.]\d{3}).*?\n'
+    r'([\s\S]*?)'
+    r'(?=\n{2,}\d+\s*\n|\Z)',
+    re.MULTILINE
+)
+# سه خط جدید یا بیشتر در ترجمه‌ها به یک خط خالی کاهش می‌یابد
+_MULTI_NL_RE = re.compile(r'\n{3,}')
+# برچسب‌هایی که ممکن است مدل در ابتدای ترجمه اضافه کند
+_LEAD_LABELS = ('ترجمه فارسی:', 'ترجمه:')
+_COMMA_TRANS = str.maketrans({'.': ','})
+# شماره [n] که ممکن است مدل در ابتدا یا انتهای هر ترجمه JSON تکرار کند
+_ITEM_MARKER_RE = re.compile(r'^\[\d+\]\s*|\s*\[\d+\]$')
 
-@dataclass
+
+@dataclass(slots=True)
 class SubtitleBlock:
     """کلاس داده برای نگهداری اطلاعات هر بلوک زیرنویس"""
     index: int
@@ -63,23 +99,19 @@ class SRTParser:
         # نرمال‌سازی خطوط جدید
         content = content.replace('\r\n', '\n').replace('\r', '\n')
 
-        # الگوی regex برای شناسایی بلوک‌های زیرنویس
-        pattern = (
-            r'(?m)^\s*(\d+)\s*\n'
-            r'(\d{2}:\d{2}:\d{2}[,\.]\d{3})\s*-->\s*'
-            r'(\d{2}:\d{2}:\d{2}[,\.]\d{3}).*?\n'
-            r'([\s\S]*?)'
-            r'(?=\n{2,}\d+\s*\n|\Z)'
-        )
-
-        matches = re.finditer(pattern, content)
+        # شناسایی بلوک‌های زیرنویس
+        matches = _SRT_BLOCK_RE.finditer(content)
         subtitles: List[SubtitleBlock] = []
 
         for match in matches:
-            index = int(match.group(1))
-            start_time = match.group(2).replace('.', ',')
-            end_time = match.group(3).replace('.', ',')
-            text = match.group(4).strip()
+            index_str, start_time, end_time, text = match.groups()
+            index = int(index_str)
+            # بیشتر فایل‌ها از ',' استفاده می‌کنند؛ تبدیل فقط در صورت نیاز
+            if '.' in start_time:
+                start_time = start_time.translate(_COMMA_TRANS)
+            if '.' in end_time:
+                end_time = end_time.translate(_COMMA_TRANS)
+            text = text.strip()
 
             if text:  # فقط بلوک‌های دارای متن
                 subtitles.append(SubtitleBlock(
@@ -101,10 +133,13 @@ class SRTParser:
     @staticmethod
     def write_srt(subtitles: List[SubtitleBlock], output_path: str):
         """نوشتن بلوک‌های زیرنویس به فایل SRT"""
-        subtitles_sorted = sorted(subtitles, key=lambda s: s.index)
+        # زیرنویس‌ها معمولاً از قبل مرتب هستند؛ مرتب‌سازی فقط در صورت نیاز
+        subtitles_sorted = subtitles
+        if any(a.index > b.index for a, b in zip(subtitles, islice(subtitles, 1, None))):
+            subtitles_sorted = sorted(subtitles, key=attrgetter('index'))
 
         try:
-            with open(output_path, 'w', encoding='utf-8') as file:
+            with open(output_path, 'w', encoding='utf-8', buffering=1 << 20) as file:
                 for subtitle in subtitles_sorted:
                     file.write(f"{subtitle.index}\n")
                     file.write(f"{subtitle.start_time} --> {subtitle.end_time}\n")
@@ -115,19 +150,63 @@ class SRTParser:
             logger.error(f"❌ خطا در نوشتن فایل: {e}")
 
 
+class RateLimiter:
+    """محدودکننده نرخ درخواست (token bucket) امن برای چند thread"""
+
+    def __init__(self, requests_per_minute: int):
+        """
+        Args:
+            requests_per_minute: حداکثر تعداد درخواست در دقیقه
+        """
+        self.capacity = float(requests_per_minute)
+        self.fill_rate = requests_per_minute / 60.0
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """مسدود کردن thread تا زمان آزاد شدن یک توکن"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.timestamp) * self.fill_rate
+                )
+                self.timestamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait_time)
+
+
 class GroqTranslator:
     """کلاس ترجمه با استفاده از Groq API"""
 
-    def __init__(self, api_key: str, model: str = "llama-3.3-70b-versatile"):
+    def __init__(self, api_key: str, model: str = "llama-3.3-70b-versatile",
+                 max_workers: int = 4, requests_per_minute: int = 30):
         """
         مقداردهی اولیه مترجم Groq
         
         Args:
             api_key: کلید API Groq
             model: نام مدل (پیش‌فرض: llama-3.3-70b-versatile)
+            max_workers: تعداد درخواست‌های همزمان
+            requests_per_minute: سقف درخواست در دقیقه (0 برای غیرفعال)
         """
-        self.client = Groq(api_key=api_key)
+        # retry داخلی SDK غیرفعال است تا حلقه _call_api به تنهایی
+        # Retry-After، rate limiter و خطاهای گذرا (اتصال، timeout و 5xx) را مدیریت کند
+        self.client = Groq(api_key=api_key, max_retries=0)
         self.model = model
+        self.max_workers = max(1, max_workers)
+        # تعداد تلاش مجدد برای 429 و خطاهای گذرا (اتصال، timeout و 5xx)
+        self.api_retries = 3
+        # cache ترجمه بر اساس متن منبع (فقط از thread اصلی خوانده/نوشته می‌شود)
+        self._trans_cache: Dict[str, str] = {}
+        self.rate_limiter = (
+            RateLimiter(requests_per_minute) if requests_per_minute > 0 else None
+        )
         
         # دیکشنری اصطلاحات و تگ‌های صوتی رایج نروژی
         self.sound_tags = {
@@ -141,9 +220,23 @@ class GroqTranslator:
             "[skriking]": "[جیغ]",
             "[klapping]": "[کف زدن]",
         }
+        # الگوی یک‌مرحله‌ای برای جایگزینی همه تگ‌ها
+        self._tag_re = re.compile('|'.join(map(re.escape, self.sound_tags)))
+
+        # پیام سیستمی ثابت یک بار ساخته می‌شود؛ پیشوند یکسان همه درخواست‌ها
+        # امکان استفاده از prompt caching سمت Groq را فراهم می‌کند
+        self._system_msg = {"role": "system", "content": self.create_system_prompt()}
         
         logger.info(f"✅ GroqTranslator با مدل {model} راه‌اندازی شد")
 
+    def replace_sound_tags(self, text: str) -> str:
+        """جایگزینی تگ‌های صوتی نروژی با معادل فارسی در یک مرحله"""
+        # بیشتر زیرنویس‌ها هیچ تگی ندارند
+        if '[' not in text:
+            return text
+        tag_map = self.sound_tags
+        return self._tag_re.sub(lambda m: tag_map[m.group(0)], text)
+
     def create_system_prompt(self) -> str:
         """ساخت پرامپت سیستمی بهینه برای ترجمه"""
         return """شما یک مترجم حرفه‌ای و متخصص در ترجمه زیرنویس فیلم از نروژی به فارسی هستید.
@@ -178,9 +271,7 @@ class GroqTranslator:
             context: زمینه از زیرنویس‌های قبلی (اختیاری)
         """
         # جایگزینی تگ‌های صوتی
-        processed_text = text
-        for nor_tag, per_tag in self.sound_tags.items():
-            processed_text = processed_text.replace(nor_tag, per_tag)
+        processed_text = self.replace_sound_tags(text)
 
         prompt = f"""متن زیرنویس نروژی زیر را به فارسی محاوره‌ای ترجمه کنید:
 
@@ -210,11 +301,7 @@ class GroqTranslator:
             context: زمینه از زیرنویس‌های قبلی
         """
         # پردازش تگ‌های صوتی
-        processed_texts = []
-        for text in texts:
-            for nor_tag, per_tag in self.sound_tags.items():
-                text = text.replace(nor_tag, per_tag)
-            processed_texts.append(text)
+        processed_texts = [self.replace_sound_tags(text) for text in texts]
 
         # ساخت لیست شماره‌دار
         numbered_texts = "\n\n".join([
@@ -236,18 +323,32 @@ class GroqTranslator:
 • اسامی خاص را به لاتین بنویسید
 • حداکثر 35-40 کاراکتر فارسی در هر خط
 
-**فرمت خروجی (دقیقاً همان شماره‌ها):**
-[1] ترجمه فارسی
-[2] ترجمه فارسی
-[3] ترجمه فارسی
-...
+**فرمت خروجی (JSON):**
+{{"translations": ["ترجمه اول", "ترجمه دوم", ...]}}
 
-فقط ترجمه‌های شماره‌دار را بنویسید، بدون متن اضافی."""
+فقط یک شیء JSON برگردانید، بدون متن اضافی. آرایه translations باید دقیقاً {len(texts)} عنصر به همان ترتیب شماره‌ها داشته باشد."""
 
         return prompt
 
+    @staticmethod
+    def _backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        محاسبه زمان انتظار قبل از تلاش مجدد
+        
+        Args:
+            attempt: شماره تلاش (از 0)
+            retry_after: مقدار هدر Retry-After (ثانیه)، در صورت وجود
+        """
+        try:
+            wait_time = float(retry_after)
+        except (TypeError, ValueError):
+            wait_time = 2 ** attempt
+        # jitter برای جلوگیری از ارسال همزمان درخواست‌ها توسط threadها
+        return wait_time + random.uniform(0, 0.5)
+
     def _call_api(self, messages: List[Dict], temperature: float = 0.3,
-                  max_tokens: int = 2000, timeout: int = 30) -> Optional[str]:
+                  max_tokens: int = 2000, timeout: int = 30,
+                  json_mode: bool = False) -> Optional[str]:
         """
         فراخوانی API Groq
         
@@ -256,25 +357,59 @@ class GroqTranslator:
             temperature: میزان تصادفی بودن (0-2)
             max_tokens: حداکثر توکن‌های تولیدی
             timeout: زمان timeout
+            json_mode: درخواست خروجی JSON معتبر از مدل
         """
-        try:
-            chat_completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                top_p=0.9,
-                stream=False,
-            )
-            
-            content = chat_completion.choices[0].message.content
-            if content:
-                return content.strip()
-            return None
-            
-        except Exception as e:
-            logger.error(f"❌ خطا در فراخوانی API: {e}")
-            return None
+        extra_args = {}
+        if json_mode:
+            extra_args["response_format"] = {"type": "json_object"}
+
+        for attempt in range(self.api_retries + 1):
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+
+            try:
+                chat_completion = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    top_p=0.9,
+                    stream=False,
+                    **extra_args,
+                )
+                
+                content = chat_completion.choices[0].message.content
+                if content:
+                    return content.strip()
+                return None
+
+            except RateLimitError as e:
+                if attempt == self.api_retries:
+                    logger.error(f"❌ محدودیت نرخ API بعد از {attempt + 1} تلاش: {e}")
+                    return None
+                # استفاده از هدر Retry-After در صورت وجود
+                response = getattr(e, "response", None)
+                retry_after = response.headers.get("retry-after") if response is not None else None
+                wait_time = self._backoff_delay(attempt, retry_after)
+                logger.warning(f"⏳ محدودیت نرخ (429)، تلاش مجدد پس از {wait_time:.1f} ثانیه...")
+                time.sleep(wait_time)
+
+            except (APIConnectionError, APIStatusError) as e:
+                # خطاهای گذرا (اتصال، timeout و 5xx) همانند retry داخلی SDK
+                # تکرار می‌شوند؛ سایر خطاهای وضعیت (4xx) تلاش مجدد ندارند
+                transient = isinstance(e, APIConnectionError) or e.status_code >= 500
+                if not transient or attempt == self.api_retries:
+                    logger.error(f"❌ خطا در فراخوانی API: {e}")
+                    return None
+                wait_time = self._backoff_delay(attempt)
+                logger.warning(f"⏳ خطای گذرای API ({e})، تلاش مجدد پس از {wait_time:.1f} ثانیه...")
+                time.sleep(wait_time)
+
+            except Exception as e:
+                logger.error(f"❌ خطا در فراخوانی API: {e}")
+                return None
+
+        return None
 
     def translate_text(self, text: str, context: str = "", 
                       retry_count: int = 3) -> str:
@@ -289,7 +424,7 @@ class GroqTranslator:
         prompt = self.create_translation_prompt(text, context)
         
         messages = [
-            {"role": "system", "content": self.create_system_prompt()},
+            self._system_msg,
             {"role": "user", "content": prompt}
         ]
 
@@ -300,90 +435,175 @@ class GroqTranslator:
                 # پاکسازی ترجمه از متن اضافی
                 clean_result = result.strip()
                 # حذف عبارات اضافی که ممکن است مدل اضافه کند
-                clean_result = re.sub(r'^(ترجمه فارسی:|ترجمه:)\s*', '', clean_result, flags=re.IGNORECASE)
+                for label in _LEAD_LABELS:
+                    if clean_result.startswith(label):
+                        clean_result = clean_result[len(label):].lstrip()
+                        break
                 return clean_result
 
             if attempt < retry_count - 1:
-                wait_time = 2 ** attempt
-                logger.warning(f"⏳ تلاش مجدد پس از {wait_time} ثانیه...")
+                wait_time = self._backoff_delay(attempt)
+                logger.warning(f"⏳ تلاش مجدد پس از {wait_time:.1f} ثانیه...")
                 time.sleep(wait_time)
 
         logger.error(f"❌ ترجمه ناموفق بعد از {retry_count} تلاش")
         return text
 
+    def _build_context(self, subtitles: List[SubtitleBlock], start: int) -> str:
+        """
+        ساخت زمینه از سه زیرنویس قبل از یک موقعیت؛ برای زیرنویس‌هایی که
+        ترجمه‌شان هنوز آماده نیست متن اصلی استفاده می‌شود
+        
+        Args:
+            subtitles: لیست بلوک‌های زیرنویس
+            start: اندیس اولین زیرنویس دسته
+        """
+        if start == 0:
+            return ""
+        context_parts = []
+        for sub in subtitles[max(0, start - 3):start]:
+            # تکراری‌ها ترجمه را از cache می‌گیرند (این متد فقط در thread اصلی اجرا می‌شود)
+            text = (sub.translated_text
+                    or self._trans_cache.get(sub.text.strip())
+                    or sub.text)
+            if text:
+                context_parts.append(text[:50])
+        return " ← ".join(context_parts)
+
+    def _translate_one_batch(self, batch: List[SubtitleBlock], context: str) -> int:
+        """
+        ترجمه یک دسته زیرنویس (اجرا در thread کاری)
+        
+        Args:
+            batch: بلوک‌های زیرنویس این دسته
+            context: زمینه از زیرنویس‌های قبلی
+            
+        Returns:
+            تعداد زیرنویس‌های ترجمه‌شده
+        """
+        translated_count = 0
+        batch_texts = [sub.text for sub in batch]
+
+        # درخواست دسته‌ای
+        prompt = self.create_batch_prompt(batch_texts, context)
+        messages = [
+            self._system_msg,
+            {"role": "user", "content": prompt}
+        ]
+
+        result = self._call_api(messages, temperature=0.3, max_tokens=2000,
+                                json_mode=True)
+
+        if not result:
+            logger.warning("⚠️ ترجمه دسته‌ای ناموفق، استفاده از ترجمه تکی...")
+            for sub in batch:
+                sub.translated_text = self.translate_text(sub.text, context)
+                translated_count += 1
+            return translated_count
+
+        # استخراج ترجمه‌ها از پاسخ JSON
+        try:
+            translations = json.loads(result)["translations"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            translations = None
+
+        # fallback به ترجمه تکی
+        if not isinstance(translations, list) or len(translations) != len(batch):
+            logger.warning("⚠️ فرمت پاسخ نامعتبر، استفاده از ترجمه تکی...")
+            for sub in batch:
+                sub.translated_text = self.translate_text(sub.text, context)
+                translated_count += 1
+            return translated_count
+
+        for sub, translation in zip(batch, translations):
+            # حذف شماره [n] احتمالی در ابتدا یا انتهای ترجمه
+            clean_translation = _ITEM_MARKER_RE.sub('', str(translation).strip())
+            # حذف خطوط اضافی
+            clean_translation = _MULTI_NL_RE.sub('\n\n', clean_translation)
+
+            sub.translated_text = clean_translation
+            translated_count += 1
+
+        return translated_count
+
     def translate_batch(self, subtitles: List[SubtitleBlock], 
                        batch_size: int = 5) -> List[SubtitleBlock]:
         """
-        ترجمه دسته‌ای زیرنویس‌ها
+        ترجمه دسته‌ای زیرنویس‌ها به صورت موازی
+        
+        حداکثر max_workers دسته همزمان ارسال می‌شوند؛ زمینه هر دسته از
+        زیرنویس‌های درست قبل از آن ساخته می‌شود.
         
         Args:
             subtitles: لیست بلوک‌های زیرنویس
             batch_size: تعداد زیرنویس در هر دسته
         """
-        total = len(subtitles)
+        # متن‌های تکراری فقط یک بار ترجمه می‌شوند
+        pending: List[SubtitleBlock] = []
+        # موقعیت هر زیرنویس pending در subtitles، برای ساخت زمینه
+        positions: List[int] = []
+        duplicates: List[SubtitleBlock] = []
+        seen = set()
+        for pos, sub in enumerate(subtitles):
+            key = sub.text.strip()
+            if key in self._trans_cache:
+                sub.translated_text = self._trans_cache[key]
+            elif key in seen:
+                duplicates.append(sub)
+            else:
+                seen.add(key)
+                pending.append(sub)
+                positions.append(pos)
+
+        reused = len(subtitles) - len(pending)
+        if reused:
+            logger.info(f"♻️ {reused} زیرنویس تکراری بدون فراخوانی API ترجمه می‌شود")
+
+        total = len(pending)
         translated_count = 0
-
-        for i in range(0, total, batch_size):
-            batch = subtitles[i:i + batch_size]
-            batch_texts = [sub.text for sub in batch]
-
-            # ساخت زمینه از زیرنویس‌های قبلی
-            context = ""
-            if i > 0:
-                prev_subtitles = subtitles[max(0, i - 3):i]
-                context_parts = []
-                for sub in prev_subtitles:
-                    if sub.translated_text:
-                        context_parts.append(sub.translated_text[:50])
-                context = " ← ".join(context_parts)
-
-            # درخواست دسته‌ای
-            prompt = self.create_batch_prompt(batch_texts, context)
-            messages = [
-                {"role": "system", "content": self.create_system_prompt()},
-                {"role": "user", "content": prompt}
-            ]
-
-            result = self._call_api(messages, temperature=0.3, max_tokens=2000)
-
-            if not result:
-                logger.warning("⚠️ ترجمه دسته‌ای ناموفق، استفاده از ترجمه تکی...")
-                for sub in batch:
-                    sub.translated_text = self.translate_text(sub.text, context)
-                    translated_count += 1
-                time.sleep(1)
-                continue
-
-            # استخراج ترجمه‌ها با regex
-            pattern = r'\[(\d+)\]\s*(.*?)(?=\n\s*\[\d+\]|\Z)'
-            pairs = re.findall(pattern, result, flags=re.DOTALL)
-
-            translations_applied = False
-            for num_str, translation in pairs:
-                idx_local = int(num_str) - 1
-                if 0 <= idx_local < len(batch):
-                    clean_translation = translation.strip()
-                    # حذف خطوط اضافی
-                    clean_translation = re.sub(r'\n{3,}', '\n\n', clean_translation)
-                    
-                    batch[idx_local].translated_text = clean_translation
-                    translated_count += 1
-                    translations_applied = True
-
-            # fallback به ترجمه تکی
-            if not translations_applied:
-                logger.warning("⚠️ فرمت پاسخ نامعتبر، استفاده از ترجمه تکی...")
-                for sub in batch:
-                    if not sub.translated_text:
-                        sub.translated_text = self.translate_text(sub.text, context)
-                        translated_count += 1
-
-            # نمایش پیشرفت
-            progress = (translated_count / total) * 100
-            logger.info(f"📊 پیشرفت: {translated_count}/{total} ({progress:.1f}%)")
-            
-            # تاخیر برای جلوگیری از rate limiting
-            time.sleep(0.5)
+        next_report = 1  # دهک بعدی پیشرفت برای گزارش در سطح INFO
+        batch_starts = iter(range(0, total, batch_size))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures: Dict[Future, List[SubtitleBlock]] = {}
+
+            def submit(i: int) -> None:
+                # زمینه هر دسته هنگام ارسال از زیرنویس‌های قبلی خودش ساخته می‌شود
+                batch = pending[i:i + batch_size]
+                context = self._build_context(subtitles, positions[i])
+                futures[executor.submit(self._translate_one_batch, batch, context)] = batch
+
+            # پنجره لغزان: حداکثر max_workers دسته همزمان در جریان است و
+            # با پایان هر دسته، دسته بعدی بدون انتظار برای کندترین دسته ارسال می‌شود
+            for i in islice(batch_starts, self.max_workers):
+                submit(i)
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = futures.pop(future)
+                    translated_count += future.result()
+
+                    # ذخیره ترجمه‌ها در cache (فقط از thread اصلی)
+                    for sub in batch:
+                        if sub.translated_text and sub.translated_text != sub.text:
+                            self._trans_cache[sub.text.strip()] = sub.translated_text
+
+                    # نمایش پیشرفت (INFO فقط در هر 10 درصد)
+                    logger.debug("📊 پیشرفت: %d/%d", translated_count, total)
+                    if translated_count * 10 >= next_report * total:
+                        next_report = translated_count * 10 // total + 1
+                        logger.info(
+                            f"📊 پیشرفت: {translated_count}/{total} "
+                            f"({translated_count * 100 // total}%)"
+                        )
+
+                    next_start = next(batch_starts, None)
+                    if next_start is not None:
+                        submit(next_start)
+
+        for sub in duplicates:
+            sub.translated_text = self._trans_cache.get(sub.text.strip())
 
         return subtitles
 
@@ -391,16 +611,19 @@ class GroqTranslator:
 class SRTTranslationManager:
     """مدیریت کل فرآیند ترجمه"""
 
-    def __init__(self, api_key: str, model: str = "llama-3.3-70b-versatile"):
+    def __init__(self, api_key: str, model: str = "llama-3.3-70b-versatile",
+                 max_workers: int = 4, requests_per_minute: int = 30):
         """
         مقداردهی اولیه مدیر ترجمه
         
         Args:
             api_key: کلید API Groq
             model: نام مدل
+            max_workers: تعداد درخواست‌های همزمان
+            requests_per_minute: سقف درخواست در دقیقه
         """
         self.parser = SRTParser()
-        self.translator = GroqTranslator(api_key, model)
+        self.translator = GroqTranslator(api_key, model, max_workers, requests_per_minute)
         logger.info(f"🚀 SRTTranslationManager با مدل {model} آماده شد")
 
     def translate_file(self, input_path: str, output_path: Optional[str] = None,
@@ -449,9 +672,23 @@ class SRTTranslationManager:
         return output_path
 
 
+def buffer_stdout() -> None:
+    """بافر کردن خروجی وضعیت؛ نوشتن فقط هنگام flush یا پایان برنامه"""
+    sys.stdout.flush()
+    sys.stdout = io.TextIOWrapper(
+        sys.stdout.buffer,
+        encoding='utf-8',
+        line_buffering=False,
+        write_through=False
+    )
+    atexit.register(sys.stdout.flush)
+
+
 def main():
     """تابع اصلی برنامه"""
     
+    buffer_stdout()
+    
     # 🔑 کلید API خود را اینجا قرار دهید
     DEFAULT_API_KEY = ""  # کلید API خود را اینجا بگذارید
     
@@ -481,6 +718,10 @@ def main():
                        help='مدل مورد استفاده (پیش‌فرض: llama-3.3-70b-versatile)')
     parser.add_argument('-b', '--batch-size', type=int, default=5,
                        help='تعداد زیرنویس در هر دسته (پیش‌فرض: 5)')
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                       help='تعداد درخواست‌های همزمان (پیش‌فرض: 4)')
+    parser.add_argument('--rpm', type=int, default=30,
+                       help='سقف درخواست در دقیقه، 0 برای غیرفعال (پیش‌فرض: 30)')
 
     args = parser.parse_args()
 
@@ -489,16 +730,22 @@ def main():
         print(f"❌ خطا: فایل {args.input_file} پیدا نشد")
         return 1
 
-    print("=" * 60)
-    print("🎬 مترجم حرفه‌ای زیرنویس SRT با Groq API")
-    print("=" * 60)
-    print(f"📥 فایل ورودی: {args.input_file}")
-    print(f"🤖 مدل: {args.model}")
-    print(f"📦 اندازه دسته: {args.batch_size}")
-    print("=" * 60)
+    separator = "=" * 60
+    print(
+        f"{separator}\n"
+        "🎬 مترجم حرفه‌ای زیرنویس SRT با Groq API\n"
+        f"{separator}\n"
+        f"📥 فایل ورودی: {args.input_file}\n"
+        f"🤖 مدل: {args.model}\n"
+        f"📦 اندازه دسته: {args.batch_size}\n"
+        f"🧵 درخواست‌های همزمان: {args.workers}\n"
+        f"{separator}"
+    )
+    # لاگ‌ها روی stderr نوشته می‌شوند؛ بنر باید قبل از آن‌ها نمایش داده شود
+    sys.stdout.flush()
 
     # ایجاد مدیر ترجمه
-    manager = SRTTranslationManager(args.api_key, args.model)
+    manager = SRTTranslationManager(args.api_key, args.model, args.workers, args.rpm)
 
     try:
         output_file = manager.translate_file(
@@ -508,10 +755,12 @@ def main():
         )
         
         if output_file:
-            print("\n" + "=" * 60)
-            print("✅ ترجمه با موفقیت انجام شد!")
-            print(f"📁 فایل خروجی: {output_file}")
-            print("=" * 60)
+            print(
+                f"\n{separator}\n"
+                "✅ ترجمه با موفقیت انجام شد!\n"
+                f"📁 فایل خروجی: {output_file}\n"
+                f"{separator}"
+            )
             return 0
         else:
             print("\n❌ ترجمه ناموفق بود")
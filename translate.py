@@ -10,13 +10,22 @@ import re
 import time
 import json
 import requests
-from typing import List, Optional, Dict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Optional, Dict, Tuple, Iterable, Iterator
 from dataclasses import dataclass
 from pathlib import Path
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from operator import attrgetter
+from itertools import chain
 import argparse
 
+try:
+    import orjson
+except ImportError:  # orjson اختیاری است؛ در نبود آن از json استاندارد استفاده می‌شود
+    orjson = None
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -27,8 +36,71 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# سریال‌سازی JSON درخواست/پاسخ (orjson در صورت نصب بودن)
+if orjson is not None:
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+else:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    _json_loads = json.loads
+
+_TIMECODE_RE = re.compile(r'\d{2}:\d{2}:\d{2}[,\.]\d{3}')
+_REPLY_SPLIT_RE = re.compile(r'\n(?=\s*\[\d+\])')
+_MULTI_NL_RE = re.compile(r'\n{3,}')
+_DOT_TO_COMMA = str.maketrans({'.': ','})
+
+# حداکثر طول context ارسالی از زیرنویس قبلی
+_CONTEXT_MAX_CHARS = 120
+
+# بودجه کاراکتر هر دسته و محدوده max_tokens هر درخواست دسته‌ای
+_BATCH_MAX_CHARS = 3000
+_BATCH_MIN_TOKENS = 256
+_BATCH_MAX_TOKENS = 4000
+
+# حاشیه مجاز طول پاسخ دسته‌ای، علاوه بر دو برابر طول متن ورودی
+_BATCH_REPLY_SLACK = 2048
+
+# بخش‌های ثابت پرامپت‌ها (یک بار در زمان بارگذاری ماژول ساخته می‌شوند)
+_SYSTEM_PROMPT = """You are an expert subtitle translator specializing in Norwegian to Persian (Farsi) translation for film and TV content.
+
+YOUR EXPERTISE:
+• Deep understanding of both Norwegian and Persian languages, including idioms, slang, and cultural references
+• Professional experience in subtitle localization with emphasis on timing constraints
+• Ability to convey emotion, tone, and subtext while maintaining brevity
+• Knowledge of Persian colloquial speech patterns and natural dialogue flow
+
+TRANSLATION PHILOSOPHY:
+• Prioritize viewer comprehension and reading speed
+• Maintain the original's emotional impact and dramatic timing
+• Adapt cultural references when necessary for Persian audiences
+• Preserve humor, sarcasm, and subtle meanings"""
+_SYSTEM_MESSAGE = {"role": "system", "content": _SYSTEM_PROMPT}
+
+_BATCH_PREAMBLE = """Translate these Norwegian subtitles to Persian. Each is numbered and must be translated separately.
+
+TRANSLATION GUIDELINES:
+• Use natural, conversational Persian
+• Maintain consistency in character speech patterns across subtitles
+• Adapt idioms and cultural references appropriately
+• Keep proper names in Latin script
+• Preserve timing markers and sound tags {SOUND:x}
+• Maximum 35-40 Persian characters per line for readability
+
+"""
+
+_BATCH_SUFFIX = """
 
-@dataclass
+REQUIRED FORMAT (maintain exact numbering):
+[1] Persian translation
+[2] Persian translation
+[3] Persian translation
+...
+
+Provide ONLY the numbered translations without any additional text."""
+
+
+@dataclass(slots=True)
 class SubtitleBlock:
     index: int
     start_time: str
@@ -39,41 +111,80 @@ class SubtitleBlock:
 
 class SRTParser:
     @staticmethod
-    def parse_srt(file_path: str) -> List[SubtitleBlock]:
-        with open(file_path, 'r', encoding='utf-8-sig') as file:
-            content = file.read()
+    def _parse_header(lines: List[str]) -> Optional[Tuple[int, str, str]]:
+        """استخراج شماره و زمان‌بندی از دو خط اول بلوک؛ None اگر بلوک معتبر نباشد"""
+        if len(lines) < 2 or not lines[0].strip().isdigit():
+            return None
 
-        content = content.replace('\r\n', '\n').replace('\r', '\n')
+        start_time, arrow, rest = lines[1].partition('-->')
+        end_fields = rest.split(None, 1)
+        if not arrow or not end_fields:
+            return None
+
+        start_time = start_time.strip()
+        end_time = end_fields[0]
+        if not (_TIMECODE_RE.fullmatch(start_time) and _TIMECODE_RE.fullmatch(end_time)):
+            return None
 
-        pattern = (
-            r'(?m)^\s*(\d+)\s*\n'                                  
-            r'(\d{2}:\d{2}:\d{2}[,\.]\d{3})\s*-->\s*'              
-            r'(\d{2}:\d{2}:\d{2}[,\.]\d{3}).*?\n'                  
-            r'([\s\S]*?)'                                         
-            r'(?=\n{2,}\d+\s*\n|\Z)'                               
+        return (
+            int(lines[0]),
+            start_time.translate(_DOT_TO_COMMA),
+            end_time.translate(_DOT_TO_COMMA)
         )
 
-        matches = re.finditer(pattern, content)
-        subtitles: List[SubtitleBlock] = []
+    @staticmethod
+    def iter_srt(file: Iterable[str]) -> Iterator[SubtitleBlock]:
+        """خواندن خط به خط بلوک‌های زیرنویس، بدون بارگذاری کل فایل در حافظه"""
+        current: Optional[SubtitleBlock] = None
+        buffer: List[str] = []
+
+        # رشته خالی انتهایی، آخرین بلوک را هم مثل یک خط خالی تخلیه می‌کند
+        for line in chain(file, ('',)):
+            line = line.rstrip('\n')
+            if line:
+                # خطوط فقط-فاصله در ابتدای بلوک نادیده گرفته می‌شوند
+                if buffer or line.strip():
+                    buffer.append(line)
+                continue
+            if not buffer:
+                continue
 
-        for match in matches:
-            index = int(match.group(1))
-            start_time = match.group(2).replace('.', ',')
-            end_time = match.group(3).replace('.', ',')
-            text = match.group(4).strip()
+            header = SRTParser._parse_header(buffer)
+            if header is None:
+                # پاراگراف بعدی متن همان زیرنویس قبلی است
+                if current is not None:
+                    current.text += '\n\n' + '\n'.join(buffer).strip()
+            else:
+                if current is not None:
+                    yield current
+                index, start_time, end_time = header
+                current = SubtitleBlock(
+                    index=index,
+                    start_time=start_time,
+                    end_time=end_time,
+                    text='\n'.join(buffer[2:]).strip()
+                )
+            buffer.clear()
+
+        if current is not None:
+            yield current
+
+    @staticmethod
+    def parse_srt(file_path: str) -> List[SubtitleBlock]:
+        # حالت universal newlines در open، خطوط \r\n و \r را به \n تبدیل می‌کند
+        with open(file_path, 'r', encoding='utf-8-sig') as file:
+            subtitles = list(SRTParser.iter_srt(file))
 
-            subtitles.append(SubtitleBlock(
-                index=index,
-                start_time=start_time,
-                end_time=end_time,
-                text=text
-            ))
+        # مرتب‌سازی یک‌باره بر اساس شماره، فقط اگر فایل به ترتیب نباشد؛
+        # ترجمه ترتیب را تغییر نمی‌دهد و write_srt دیگر مرتب نمی‌کند
+        if any(a.index > b.index for a, b in zip(subtitles, subtitles[1:])):
+            subtitles.sort(key=attrgetter('index'))
 
         logger.info(f"تعداد {len(subtitles)} بلوک زیرنویس پارس شد")
 
         if len(subtitles) < 5:
             logger.warning(
-                "تعداد بلوک‌ها غیرعادی کم است؛ احتمالاً فرمت SRT یا regex نیاز به بررسی دارد."
+                "تعداد بلوک‌ها غیرعادی کم است؛ احتمالاً فرمت SRT نیاز به بررسی دارد."
             )
 
         return subtitles
@@ -81,13 +192,14 @@ class SRTParser:
     @staticmethod
     def write_srt(subtitles: List[SubtitleBlock], output_path: str):
         """نوشتن بلوک‌های زیرنویس به فایل SRT"""
-        subtitles_sorted = sorted(subtitles, key=lambda s: s.index)
+        chunks = [
+            f"{s.index}\n{s.start_time} --> {s.end_time}\n"
+            f"{(s.translated_text or s.text).strip()}\n\n"
+            for s in subtitles
+        ]
 
         with open(output_path, 'w', encoding='utf-8') as file:
-            for subtitle in subtitles_sorted:
-                file.write(f"{subtitle.index}\n")
-                file.write(f"{subtitle.start_time} --> {subtitle.end_time}\n")
-                file.write(f"{(subtitle.translated_text or subtitle.text).strip()}\n\n")
+            file.write(''.join(chunks))
 
         logger.info(f"فایل ترجمه شده در {output_path} ذخیره شد")
 
@@ -95,6 +207,9 @@ class SRTParser:
 class AvalaiTranslator:
     """کلاس برای ترجمه متون با استفاده از Avalai API"""
 
+    # حداکثر اتصال‌های نگه‌داشته‌شده به API
+    POOL_SIZE = 32
+
     def __init__(self, api_key: str, model: str = "gpt-4"):
         self.api_key = api_key
         self.model = model
@@ -105,6 +220,27 @@ class AvalaiTranslator:
         }
         self.session = requests.Session()
         self.session.headers.update(self.headers)
+        # pool اتصال به اندازه کافی بزرگ برای درخواست‌های همزمان دسته‌ها
+        # (pool پیش‌فرض requests فقط 10 اتصال نگه می‌دارد)؛ تلاش مجدد با
+        # backoff نمایی و رعایت هدر Retry-After برای خطاهای 429 و 5xx؛
+        # read=0 چون POST پس از ارسال تکرارپذیر نیست و هر تلاش هزینه دارد
+        retry = Retry(
+            total=3,
+            read=0,
+            backoff_factor=1.0,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["POST"],
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=self.POOL_SIZE,
+            pool_maxsize=self.POOL_SIZE,
+            max_retries=retry
+        ))
+
+        # cache ترجمه بر اساس متن منبع (فقط از thread اصلی خوانده/نوشته می‌شود)
+        self._cache: Dict[str, str] = {}
         
         # دیکشنری اصطلاحات رایج نروژی
         self.common_terms = {
@@ -118,29 +254,39 @@ class AvalaiTranslator:
             }
         }
 
-    def create_enhanced_system_prompt(self) -> str:
-        """ساخت پرامپت سیستمی بهینه‌شده"""
-        return """You are an expert subtitle translator specializing in Norwegian to Persian (Farsi) translation for film and TV content.
+        # الگوهای یک‌مرحله‌ای برای جایگزینی تگ‌های صدا و بازگرداندن آن‌ها
+        sound_tags = self.common_terms["sound_tags"]
+        self._sound_tag_map = {eng: f"{{SOUND:{per}}}" for eng, per in sound_tags.items()}
+        self._sound_tag_re = re.compile('|'.join(map(re.escape, self._sound_tag_map)))
+        self._sound_placeholder_map = {f"{{SOUND:{per}}}": per for per in sound_tags.values()}
+        self._sound_placeholder_re = re.compile(
+            '|'.join(map(re.escape, self._sound_placeholder_map))
+        )
 
-YOUR EXPERTISE:
-• Deep understanding of both Norwegian and Persian languages, including idioms, slang, and cultural references
-• Professional experience in subtitle localization with emphasis on timing constraints
-• Ability to convey emotion, tone, and subtext while maintaining brevity
-• Knowledge of Persian colloquial speech patterns and natural dialogue flow
+    def replace_sound_tags(self, text: str) -> str:
+        """تبدیل تگ‌های صدای نروژی به placeholder در یک مرحله"""
+        if '[' not in text:
+            return text
+        tag_map = self._sound_tag_map
+        return self._sound_tag_re.sub(lambda m: tag_map[m.group(0)], text)
 
-TRANSLATION PHILOSOPHY:
-• Prioritize viewer comprehension and reading speed
-• Maintain the original's emotional impact and dramatic timing
-• Adapt cultural references when necessary for Persian audiences
-• Preserve humor, sarcasm, and subtle meanings"""
+    def restore_sound_tags(self, text: str) -> str:
+        """بازگرداندن placeholderهای صدا به تگ فارسی در یک مرحله"""
+        if '{SOUND:' not in text:
+            return text
+        placeholder_map = self._sound_placeholder_map
+        return self._sound_placeholder_re.sub(lambda m: placeholder_map[m.group(0)], text)
+
+    def create_enhanced_system_prompt(self) -> str:
+        """ساخت پرامپت سیستمی بهینه‌شده"""
+        return _SYSTEM_PROMPT
 
     def create_translation_prompt(self, text: str, context: str = "", 
                                  scene_description: str = "") -> str:
         """ساخت پرامپت بهینه برای ترجمه زیرنویس"""
         
         # پیش‌پردازش تگ‌های صدا
-        for eng, per in self.common_terms["sound_tags"].items():
-            text = text.replace(eng, f"{{SOUND:{per}}}")
+        text = self.replace_sound_tags(text)
         
         prompt = f"""Translate the following Norwegian subtitle to Persian (Farsi).
 
@@ -179,38 +325,18 @@ OUTPUT: Provide ONLY the Persian translation without any explanation or metadata
         """پرامپت بهینه‌شده برای ترجمه دسته‌ای"""
         
         # پیش‌پردازش تگ‌های صدا برای همه متون
-        processed_texts = []
-        for text in texts:
-            for eng, per in self.common_terms["sound_tags"].items():
-                text = text.replace(eng, f"{{SOUND:{per}}}")
-            processed_texts.append(text)
-        
-        combined_text = "\n---\n".join([f"[{i+1}] {text}" for i, text in enumerate(processed_texts)])
+        processed_texts = [self.replace_sound_tags(text) for text in texts]
         
-        prompt = f"""Translate these Norwegian subtitles to Persian. Each is numbered and must be translated separately.
-
-TRANSLATION GUIDELINES:
-• Use natural, conversational Persian
-• Maintain consistency in character speech patterns across subtitles
-• Adapt idioms and cultural references appropriately
-• Keep proper names in Latin script
-• Preserve timing markers and sound tags {{SOUND:x}}
-• Maximum 35-40 Persian characters per line for readability
-
-{f'CONTEXT FROM PREVIOUS SUBTITLES: {context[:300]}' if context else ''}
-
-SUBTITLES TO TRANSLATE:
-{combined_text}
-
-REQUIRED FORMAT (maintain exact numbering):
-[1] Persian translation
-[2] Persian translation
-[3] Persian translation
-...
-
-Provide ONLY the numbered translations without any additional text."""
+        combined_text = "\n---\n".join(f"[{i}] {text}" for i, text in enumerate(processed_texts, 1))
+        context_line = (
+            f'CONTEXT FROM PREVIOUS SUBTITLES: {context[:_CONTEXT_MAX_CHARS]}' if context else ''
+        )
         
-        return prompt
+        return (
+            _BATCH_PREAMBLE + context_line
+            + "\n\nSUBTITLES TO TRANSLATE:\n" + combined_text
+            + _BATCH_SUFFIX
+        )
 
     def _post_chat(self, messages: List[Dict], temperature: float = 0.3, 
                    max_tokens: int = 1000, timeout: int = 45) -> Optional[str]:
@@ -218,7 +344,7 @@ Provide ONLY the numbered translations without any additional text."""
         
         # اضافه کردن پرامپت سیستمی
         full_messages = [
-            {"role": "system", "content": self.create_enhanced_system_prompt()},
+            _SYSTEM_MESSAGE,
             *messages
         ]
         
@@ -232,18 +358,17 @@ Provide ONLY the numbered translations without any additional text."""
         }
         
         try:
-            resp = self.session.post(self.base_url, json=payload, timeout=timeout)
+            resp = self.session.post(self.base_url, data=_json_dumps(payload), timeout=timeout)
             if resp.status_code == 200:
-                data = resp.json()
+                data = _json_loads(resp.content)
                 content = data.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
                 
                 # پس‌پردازش: بازگرداندن تگ‌های صدا
-                for placeholder, persian in self.common_terms["sound_tags"].items():
-                    content = content.replace(f"{{SOUND:{persian}}}", persian)
+                content = self.restore_sound_tags(content)
                 
                 return content
             elif resp.status_code == 429:
-                logger.warning("Rate limit دریافت شد.")
+                logger.warning("Rate limit دریافت شد (پس از تلاش‌های مجدد).")
                 return None
             else:
                 logger.error(f"API Error: {resp.status_code} - {resp.text}")
@@ -253,92 +378,175 @@ Provide ONLY the numbered translations without any additional text."""
             return None
 
     def translate_text(self, text: str, context: str = "", 
-                      scene_description: str = "", retry_count: int = 3) -> str:
-        """ترجمه یک متن با مدیریت خطا و retry"""
+                      scene_description: str = "") -> str:
+        """ترجمه یک متن؛ تلاش مجدد توسط Retry در session انجام می‌شود"""
         prompt = self.create_translation_prompt(text, context, scene_description)
 
-        for attempt in range(retry_count):
-            result = self._post_chat(
-                [{"role": "user", "content": prompt}], 
-                temperature=0.3, 
-                max_tokens=1000, 
-                timeout=45
+        result = self._post_chat(
+            [{"role": "user", "content": prompt}], 
+            temperature=0.3, 
+            max_tokens=1000, 
+            timeout=45
+        )
+        if result:
+            return result
+
+        logger.warning("ترجمه تکی ناموفق؛ متن اصلی حفظ شد.")
+        return text
+
+    @staticmethod
+    def _parse_batch_reply(result: str) -> List[Tuple[int, str]]:
+        """تقسیم پاسخ دسته‌ای به (شماره، ترجمه) روی نشانگرهای [n] در ابتدای خط"""
+        pairs = []
+        for part in _REPLY_SPLIT_RE.split(result.strip()):
+            part = part.lstrip()
+            if not part.startswith('['):
+                continue
+            num_str, bracket, translation = part[1:].partition(']')
+            if bracket and num_str.isdigit():
+                pairs.append((int(num_str), translation))
+        return pairs
+
+    def _translate_one_batch(self, batch: List[SubtitleBlock], context: str) -> int:
+        """ترجمه یک دسته زیرنویس؛ تعداد زیرنویس‌های ترجمه‌شده را برمی‌گرداند"""
+        # استخراج متون دسته
+        batch_texts = [sub.text for sub in batch]
+
+        # max_tokens متناسب با طول متن دسته
+        batch_chars = sum(len(text) for text in batch_texts)
+        max_tokens = min(_BATCH_MAX_TOKENS, max(_BATCH_MIN_TOKENS, 4 * batch_chars))
+
+        # درخواست دسته‌ای با پرامپت بهینه‌شده
+        prompt = self.create_batch_prompt(batch_texts, context)
+        result = self._post_chat(
+            [{"role": "user", "content": prompt}], 
+            temperature=0.3, 
+            max_tokens=max_tokens, 
+            timeout=60
+        )
+
+        # بررسی سریع پاسخ پیش از پارس: پاسخ بی‌ساختار یا بیش از حد طولانی
+        # مستقیماً به ترجمه تکی می‌رود
+        malformed = True
+        if not result:
+            logger.error("ترجمهٔ دسته‌ای ناموفق؛ سوییچ به ترجمهٔ تکی.")
+        elif '[1]' not in result.lstrip()[:10]:
+            logger.warning("پاسخ دسته‌ای با [1] شروع نشد؛ fallback به ترجمه تکی.")
+        elif len(result) > 2 * batch_chars + _BATCH_REPLY_SLACK:
+            logger.warning(
+                f"پاسخ دسته‌ای بیش از حد طولانی است ({len(result)} کاراکتر)؛ "
+                "fallback به ترجمه تکی."
             )
-            if result:
-                return result
+        else:
+            malformed = False
 
-            wait_time = 2 ** attempt
-            logger.warning(f"تلاش مجدد ترجمه تکی پس از {wait_time} ثانیه ...")
-            time.sleep(wait_time)
+        if malformed:
+            for sub in batch:
+                sub.translated_text = self.translate_text(sub.text, context)
+            return len(batch)
 
-        return text
+        # حذف خطوط اضافی (یک بار روی کل پاسخ) و استخراج ترجمه‌ها
+        pairs = self._parse_batch_reply(_MULTI_NL_RE.sub('\n\n', result))
 
-    def translate_batch(self, subtitles: List[SubtitleBlock], batch_size: int = 5) -> List[SubtitleBlock]:
-        """ترجمه دسته‌ای زیرنویس‌ها با پرامپت بهینه‌شده"""
-        total = len(subtitles)
-        translated_count = 0
+        for num, translation in pairs:
+            idx_local = num - 1
+            if 0 <= idx_local < len(batch):
+                # پاکسازی ترجمه
+                batch[idx_local].translated_text = translation.strip()
 
-        for i in range(0, total, batch_size):
-            batch = subtitles[i:i + batch_size]
-            
-            # استخراج متون دسته
-            batch_texts = [sub.text for sub in batch]
-
-            # Context از زیرنویس‌های قبلی
-            context = ""
-            if i > 0:
-                prev_subtitles = subtitles[max(0, i - 5):i]
-                context_parts = []
-                for sub in prev_subtitles[-3:]:
-                    if sub.translated_text:
-                        context_parts.append(f"[{sub.translated_text}]")
-                context = " ← ".join(context_parts)
-
-            # درخواست دسته‌ای با پرامپت بهینه‌شده
-            prompt = self.create_batch_prompt(batch_texts, context)
-            result = self._post_chat(
-                [{"role": "user", "content": prompt}], 
-                temperature=0.3, 
-                max_tokens=2000, 
-                timeout=60
+        # پاسخ ناقص (قطع‌شده یا بدون بعضی [n]): فقط موارد جاافتاده تکی ترجمه می‌شوند
+        missing = [sub for sub in batch if not sub.translated_text]
+        if missing:
+            logger.warning(
+                f"{len(missing)} مورد از {len(batch)} در پاسخ دسته‌ای نبود؛ "
+                "fallback به ترجمه تکی."
             )
+            for sub in missing:
+                sub.translated_text = self.translate_text(sub.text, context)
 
-            if not result:
-                logger.error("ترجمهٔ دسته‌ای ناموفق؛ سوییچ به ترجمهٔ تکی.")
-                for sub in batch:
-                    sub.translated_text = self.translate_text(sub.text, context)
-                    translated_count += 1
-                time.sleep(1)
-                continue
+        return len(batch)
+
+    @staticmethod
+    def _pack_batches(subtitles: List[SubtitleBlock], max_items: int,
+                      max_chars: int = _BATCH_MAX_CHARS) -> List[Tuple[int, int]]:
+        """
+        تقسیم حریصانه زیرنویس‌ها به دسته‌ها بر اساس بودجه کاراکتر
+
+        هر دسته تا رسیدن به max_items زیرنویس یا max_chars کاراکتر پر می‌شود؛
+        خروجی لیست بازه‌های (شروع، پایان) است.
+        """
+        ranges = []
+        start = 0
+        chars = 0
+        for i, sub in enumerate(subtitles):
+            size = len(sub.text)
+            if i > start and (i - start >= max_items or chars + size > max_chars):
+                ranges.append((start, i))
+                start = i
+                chars = 0
+            chars += size
+        if start < len(subtitles):
+            ranges.append((start, len(subtitles)))
+        return ranges
+
+    def translate_batch(self, subtitles: List[SubtitleBlock], batch_size: int = 20,
+                        max_workers: int = 8) -> List[SubtitleBlock]:
+        """ترجمه دسته‌ای و موازی زیرنویس‌ها با پرامپت بهینه‌شده
+
+        batch_size حداکثر تعداد زیرنویس هر دسته است؛ دسته‌ها علاوه بر آن
+        به بودجه کاراکتر _BATCH_MAX_CHARS محدود می‌شوند.
+        """
+        # تفکیک زیرنویس‌های موجود در cache و متن‌های تکراری؛
+        # هر متن یکتا فقط یک بار به API ارسال می‌شود
+        pending: List[SubtitleBlock] = []
+        # موقعیت هر زیرنویس pending در subtitles، برای context
+        positions: List[int] = []
+        duplicates: List[SubtitleBlock] = []
+        seen = set()
+        for pos, sub in enumerate(subtitles):
+            key = sub.text.strip()
+            if key in self._cache:
+                sub.translated_text = self._cache[key]
+            elif key in seen:
+                duplicates.append(sub)
+            else:
+                seen.add(key)
+                pending.append(sub)
+                positions.append(pos)
 
-            # استخراج ترجمه‌ها با regex قوی‌تر
-            pattern = r'\[(\d+)\]\s*(.*?)(?=\n\s*\[\d+\]|\Z)'
-            pairs = re.findall(pattern, result, flags=re.DOTALL)
-
-            translations_applied = False
-            for num_str, translation in pairs:
-                idx_local = int(num_str) - 1
-                if 0 <= idx_local < len(batch):
-                    # پاکسازی ترجمه
-                    clean_translation = translation.strip()
-                    # حذف خطوط اضافی
-                    clean_translation = re.sub(r'\n{3,}', '\n\n', clean_translation)
-                    
-                    batch[idx_local].translated_text = clean_translation
-                    translated_count += 1
-                    translations_applied = True
-
-            if not translations_applied:
-                logger.warning("فرمت پاسخ نامنتظر؛ fallback به ترجمه تکی.")
-                for sub in batch:
-                    if not sub.translated_text:
-                        sub.translated_text = self.translate_text(sub.text, context)
-                        translated_count += 1
-
-            logger.info(f"پیشرفت: {translated_count}/{total} زیرنویس ترجمه شد")
-            
-            # تاخیر دینامیک بر اساس API
-            time.sleep(0.8)
+        reused = len(subtitles) - len(pending)
+        if reused:
+            logger.info(f"{reused} زیرنویس تکراری از cache ترجمه می‌شود")
+
+        total = len(pending)
+        translated_count = 0
+
+        # ساخت همه دسته‌ها و context آن‌ها از قبل؛ context فقط متن اصلی
+        # زیرنویس قبلی در فایل است تا دسته‌ها به هم وابسته نباشند و توکن کمتری ارسال شود
+        jobs = []
+        for start, end in self._pack_batches(pending, batch_size):
+            batch = pending[start:end]
+            pos = positions[start]
+            context = subtitles[pos - 1].text[:_CONTEXT_MAX_CHARS] if pos > 0 else ""
+            jobs.append((batch, context))
+
+        # هر دسته بلوک‌های خودش را تغییر می‌دهد؛ ترتیب subtitles حفظ می‌شود
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {
+                executor.submit(self._translate_one_batch, batch, context): batch
+                for batch, context in jobs
+            }
+            for future in as_completed(futures):
+                translated_count += future.result()
+                logger.info(f"پیشرفت: {translated_count}/{total} زیرنویس ترجمه شد")
+
+                # ذخیره ترجمه‌ها در cache (فقط از thread اصلی)
+                for sub in futures[future]:
+                    if sub.translated_text and sub.translated_text != sub.text:
+                        self._cache[sub.text.strip()] = sub.translated_text
+
+        for sub in duplicates:
+            sub.translated_text = self._cache.get(sub.text.strip())
 
         return subtitles
 
@@ -351,7 +559,7 @@ class SRTTranslationManager:
         self.translator = AvalaiTranslator(api_key, model)
 
     def translate_file(self, input_path: str, output_path: Optional[str] = None, 
-                      batch_size: int = 5):
+                      batch_size: int = 20, concurrency: int = 8):
         """ترجمه کامل یک فایل SRT"""
         if not output_path:
             input_file = Path(input_path)
@@ -368,7 +576,9 @@ class SRTTranslationManager:
             return
 
         start_time = time.time()
-        translated_subtitles = self.translator.translate_batch(subtitles, batch_size)
+        translated_subtitles = self.translator.translate_batch(
+            subtitles, batch_size, concurrency
+        )
 
         self.parser.write_srt(translated_subtitles, str(output_path))
 
@@ -389,8 +599,11 @@ def main():
     parser.add_argument('-k', '--api-key', required=True, help='کلید API Avalai')
     parser.add_argument('-m', '--model', default='gpt-4',
                         help='مدل مورد استفاده (پیش‌فرض: gpt-4)')
-    parser.add_argument('-b', '--batch-size', type=int, default=5,
-                        help='تعداد زیرنویس در هر دسته (پیش‌فرض: 5)')
+    parser.add_argument('-b', '--batch-size', type=int, default=20,
+                        help='حداکثر تعداد زیرنویس در هر دسته؛ دسته‌ها به '
+                             f'{_BATCH_MAX_CHARS} کاراکتر نیز محدودند (پیش‌فرض: 20)')
+    parser.add_argument('-c', '--concurrency', type=int, default=8,
+                        help='تعداد درخواست‌های همزمان (پیش‌فرض: 8)')
 
     args = parser.parse_args()
 
@@ -400,7 +613,8 @@ def main():
         output_file = manager.translate_file(
             args.input_file,
             args.output,
-            args.batch_size
+            args.batch_size,
+            args.concurrency
         )
         print("\n✅ ترجمه با موفقیت انجام شد!")
         print(f"📁 فایل خروجی: {output_file}")